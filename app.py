@@ -2,7 +2,11 @@ from fastapi import FastAPI, Query, UploadFile, File
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 import chromadb
-from sentence_transformers import SentenceTransformer
+from chroma_config import CHROMA_PATH, COLLECTION_NAME, COLLECTION_METADATA, configure_hnsw_params
+from embedding_model import load_model
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
 # from add_embedding import load_json, generate_embeddings, store_in_chromadb
@@ -13,29 +17,149 @@ app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Initialize ChromaDB client
-client = chromadb.PersistentClient(path="./chromadb_store")
-collection = client.get_or_create_collection("patents_collection", metadata={"hnsw:space": "cosine"})
+client = chromadb.PersistentClient(path=CHROMA_PATH)
+collection = client.get_or_create_collection(COLLECTION_NAME, metadata=COLLECTION_METADATA)
 
 # Load BERT model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+model = load_model()
+
+# Micro-batching: concurrent /search requests are coalesced into a single
+# model.encode call and a single collection.query call instead of one per request
+BATCH_SIZE = 32  # Max queries per batch
+BATCH_WAIT = 0.01  # Seconds to wait for more queries to join a batch
+N_RESULTS = 3
+
+encode_queue = asyncio.Queue()
+search_queue = asyncio.Queue()
+
+# HNSW search gets its own threads so it doesn't contend with model inference
+SEARCH_WORKERS = 4
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+
+# LRU cache of query -> future resolving to its normalized float32 embedding.
+# Caching the future also lets identical in-flight queries share one encode.
+QUERY_CACHE_SIZE = 4096
+query_cache = OrderedDict()
+
+def encode_batch(queries):
+    embeddings = model.encode(
+        queries,
+        batch_size=BATCH_SIZE,
+        normalize_embeddings=True,
+        convert_to_numpy=True
+    )
+    embeddings.flags.writeable = False  # Rows are shared by every cache hit
+    return embeddings
+
+def search_batch(embeddings):
+    results = collection.query(
+        query_embeddings=[embedding.tolist() for embedding in embeddings],
+        n_results=N_RESULTS
+    )
+    return results.get("documents") or [[] for _ in embeddings]
+
+async def collect_batch(queue):
+    """Wait for one queued item, then keep collecting for up to BATCH_WAIT seconds"""
+    loop = asyncio.get_running_loop()
+    batch = [await queue.get()]
+    deadline = loop.time() + BATCH_WAIT
+    while len(batch) < BATCH_SIZE:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+async def batch_worker(queue, process, executor=None):
+    """Pull pending (item, future) pairs off the queue and process them in batches"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = await collect_batch(queue)
+        items = [item for item, _ in batch]
+        try:
+            # Run in a threadpool so the event loop stays responsive
+            results = await loop.run_in_executor(executor, process, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+def check_hnsw_params():
+    """Warn when the collection has outgrown the HNSW parameters it was built with"""
+    recommended = configure_hnsw_params(collection.count())
+    current = collection.metadata or {}
+    outdated = {k: v for k, v in recommended.items() if current.get(k, 0) < v}
+    if outdated:
+        print(f"HNSW parameters below recommended values for {collection.count()} vectors: {outdated}")
+        if "hnsw:M" in outdated or "hnsw:construction_ef" in outdated:
+            print("Changing hnsw:M / hnsw:construction_ef requires re-indexing the collection")
+    if current.get("hnsw:space", "l2") != COLLECTION_METADATA["hnsw:space"]:
+        print(f"Collection uses hnsw:space={current.get('hnsw:space', 'l2')}, "
+              f"re-index to switch to {COLLECTION_METADATA['hnsw:space']}")
+
+@app.on_event("startup")
+async def startup():
+    check_hnsw_params()
+
+    # Warm up the model so the first request doesn't pay for buffer allocation
+    await asyncio.get_running_loop().run_in_executor(None, encode_batch, ["warmup"])
+    app.state.batch_workers = [asyncio.create_task(batch_worker(encode_queue, encode_batch))]
+    app.state.batch_workers += [
+        asyncio.create_task(batch_worker(search_queue, search_batch, search_pool))
+        for _ in range(SEARCH_WORKERS)
+    ]
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in app.state.batch_workers:
+        task.cancel()
+    search_pool.shutdown(wait=False)
+
+async def encode_query(query):
+    future = query_cache.get(query)
+    if future is not None:
+        query_cache.move_to_end(query)
+    else:
+        future = asyncio.get_running_loop().create_future()
+        query_cache[query] = future
+        if len(query_cache) > QUERY_CACHE_SIZE:
+            query_cache.popitem(last=False)
+        await encode_queue.put((query, future))
+
+    try:
+        return await asyncio.shield(future)
+    except Exception:
+        # Don't cache failures
+        if query_cache.get(query) is future:
+            del query_cache[query]
+        raise
+
+async def search_embedding(embedding):
+    future = asyncio.get_running_loop().create_future()
+    await search_queue.put((embedding, future))
+    return await future
 
 @app.get("/")
 def serve_homepage():
     return FileResponse("static/index.html")  # Serve the HTML file
 
 @app.get("/search")
-def search(query: str = Query(..., description="Search query text")):
+async def search(query: str = Query(..., description="Search query text")):
     # Compute query embedding
-    query_embedding = model.encode([query])[0].tolist()
+    query_embedding = await encode_query(query)
 
     # Perform search in ChromaDB
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=3  # Return top 5 results
-    )
+    documents = await search_embedding(query_embedding)
 
     # Format response
-    documents = results.get("documents", [[]])[0]
     return {"query": query, "results": documents}
 
 
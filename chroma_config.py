@@ -0,0 +1,36 @@
+# Shared ChromaDB collection settings for working.py (ingest) and app.py (search).
+# Whichever script creates the collection first fixes its HNSW build parameters,
+# so both must pass the same metadata.
+
+CHROMA_PATH = "./chromadb_store"
+COLLECTION_NAME = "patents_collection"
+
+# HNSW parameter tiers by collection size: (min_count, M, construction_ef, search_ef)
+# M and construction_ef are fixed when the index is built - changing them requires
+# re-indexing the collection. search_ef only affects queries and can be raised later.
+HNSW_TIERS = [
+    (0, 24, 128, 100),
+    (1_000_000, 32, 200, 150),
+]
+
+def configure_hnsw_params(n):
+    """Return the recommended HNSW parameters for a collection of n vectors"""
+    params = None
+    for min_count, m, construction_ef, search_ef in HNSW_TIERS:
+        if n >= min_count:
+            params = {
+                "hnsw:M": m,
+                "hnsw:construction_ef": construction_ef,
+                "hnsw:search_ef": search_ef,
+            }
+    return params
+
+COLLECTION_METADATA = {
+    # Vectors are L2-normalized at encode time (ingest and query), so inner
+    # product ranks the same as cosine without normalizing in the index
+    "hnsw:space": "ip",
+    **configure_hnsw_params(0),
+    "hnsw:batch_size": 1000,
+    "hnsw:sync_threshold": 10000,
+    "hnsw:num_threads": 4,  # Matches the search thread pool in app.py
+}
@@ -0,0 +1,128 @@
+import numpy as np
+import hashlib
+import sqlite3
+import threading
+import os
+
+# Int8 ONNX export of all-MiniLM-L6-v2, produced by quantize_model.py
+ONNX_MODEL_PATH = "model_int8.onnx"
+ONNX_TOKENIZER_DIR = "onnx_minilm"
+MAX_SEQ_LENGTH = 256  # Same truncation as the SentenceTransformer model
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite3"
+
+class OnnxSentenceEncoder:
+    """Thin replacement for SentenceTransformer.encode backed by ONNX Runtime"""
+
+    def __init__(self, model_path, tokenizer_dir):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        so = ort.SessionOptions()
+        so.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            model_path,
+            providers=["CPUExecutionProvider"],
+            sess_options=so
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir, use_fast=True)
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, convert_to_numpy=True):
+        # Like SentenceTransformer, a single string gives a single vector
+        if isinstance(sentences, str):
+            return self.encode([sentences], batch_size, normalize_embeddings, convert_to_numpy)[0]
+
+        embeddings = []
+        for start in range(0, len(sentences), batch_size):
+            tokens = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors="np"
+            )
+            inputs = {k: v.astype(np.int64) for k, v in tokens.items() if k in self.input_names}
+            last_hidden_state = self.session.run(None, inputs)[0]
+
+            # Mean pooling over non-padding tokens
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings.append(pooled.astype(np.float32))
+
+        return np.concatenate(embeddings)
+
+def model_name():
+    """Name of the model load_model() returns, used to key cached embeddings"""
+    if os.path.exists(ONNX_MODEL_PATH):
+        return f"{MODEL_NAME}-onnx-int8"
+    return MODEL_NAME
+
+def load_model():
+    """
+    Load the embedding model, preferring the quantized ONNX export when it has
+    been built. Ingest (working.py) and search (app.py) must use the same one
+    so stored and query vectors come from the same model.
+    """
+    # Imported here so the heavy ML stack only loads when a model is needed
+    if os.path.exists(ONNX_MODEL_PATH):
+        return OnnxSentenceEncoder(ONNX_MODEL_PATH, ONNX_TOKENIZER_DIR)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
+
+class EmbeddingCache:
+    """
+    On-disk cache of embeddings keyed by the SHA-256 of the text and the model
+    name, so re-processed documents skip model inference and switching models
+    never returns stale vectors
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, model=None):
+        self.model = model or model_name()
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(sha256 TEXT NOT NULL, model TEXT NOT NULL, vec BLOB NOT NULL, PRIMARY KEY (sha256, model))"
+        )
+
+    @staticmethod
+    def key(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys that are cached"""
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's host parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.db.execute(
+                    f"SELECT sha256, vec FROM embeddings WHERE model = ? AND sha256 IN ({','.join('?' * len(chunk))})",
+                    (self.model, *chunk)
+                ).fetchall()
+                found.update((k, np.frombuffer(vec, dtype=np.float32)) for k, vec in rows)
+        return found
+
+    def put_many(self, keys, vectors):
+        with self._lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO embeddings (sha256, model, vec) VALUES (?, ?, ?)",
+                [(k, self.model, np.asarray(v, dtype=np.float32).tobytes()) for k, v in zip(keys, vectors)]
+            )
+
+    def close(self):
+        self.db.close()
+
+def find_uncached_texts(texts, cache):
+    """
+    Split texts into cached and uncached ones.
+    Returns (keys, cached vectors by key, indices of texts that still need encoding)
+    """
+    keys = [cache.key(text) for text in texts]
+    cached = cache.get_many(list(set(keys)))
+    uncached = [i for i, k in enumerate(keys) if k not in cached]
+    return keys, cached, uncached
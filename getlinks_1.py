@@ -1,12 +1,19 @@
 from datetime import datetime, timedelta
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+import asyncio
+import httpx
+import mmap
 import re
 import time
 from dotenv import load_dotenv
 import os
+
+try:
+    import xxhash
+    def patent_key(patent_number: bytes) -> int:
+        return xxhash.xxh3_64_intdigest(patent_number)
+except ImportError:
+    def patent_key(patent_number: bytes) -> int:
+        return hash(patent_number)
  
 # Load environment variables
 load_dotenv()
@@ -16,6 +23,18 @@ PATENTS_FILE = "patent_urls.txt"
 no_of_results = 100
 CHUNK_DAYS = 10  # Number of days to process in each chunk
 
+# Google Patents JSON search endpoint (same results as the search page, no JS rendering)
+SEARCH_API_URL = "https://patents.google.com/xhr/query"
+MAX_WORKERS = 8  # Date chunks scraped in parallel
+PROGRESS_DIR = "scraping_progress"  # One <start date>.done sentinel per finished chunk
+REQUEST_DELAY = 1  # Seconds each worker waits after a request (rate limiting)
+HEADERS = {
+    "User-Agent": os.getenv("USER_AGENT", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"),
+    "Accept": "application/json",
+}
+PATENT_RE = re.compile(r"US\d{1,11}")
+PATENT_URL_PREFIX = "https://patents.google.com/patent/"
+
 def get_date_chunks():
     """Generate date chunks from 1900 to present"""
     """Generate date chunks from 1700 to present"""
@@ -29,25 +48,35 @@ def get_date_chunks():
         current = chunk_end + timedelta(days=1)
 
 def load_existing_patents():
-    if os.path.exists(PATENTS_FILE):
-        with open(PATENTS_FILE, 'r') as f:
-            return set(line.strip() for line in f)
-    return set()
-
-def save_new_patents(new_patents, existing_patents):
-    with open(PATENTS_FILE, 'a') as f:
-        for patent in new_patents:
-            if patent not in existing_patents:
-                f.write(f"{patent}\n")
-                print(f"Saved new unique patent: {patent}")
-
-def save_progress(date):
-    """Save the last processed date to resume later"""
-    with open("scraping_progress.txt", "w") as f:
-        f.write(date.strftime("%Y-%m-%d"))
+    """Return 64-bit hashes of the patent numbers in PATENTS_FILE (8 bytes each instead of a str)"""
+    if not os.path.exists(PATENTS_FILE) or os.path.getsize(PATENTS_FILE) == 0:
+        return set()
+    with open(PATENTS_FILE, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return {patent_key(line.rstrip().rpartition(b"/")[2]) for line in iter(mm.readline, b"")}
+
+def save_new_patents(new_patents):
+    """Append patent URLs to PATENTS_FILE; callers pass only patent numbers not already saved"""
+    with open(PATENTS_FILE, 'a', buffering=1 << 16) as f:
+        f.writelines(f"{PATENT_URL_PREFIX}{patent_number}\n" for patent_number in new_patents)
+
+def chunk_done_path(start_date):
+    return os.path.join(PROGRESS_DIR, f"{start_date.strftime('%Y%m%d')}.done")
+
+def mark_chunk_done(start_date, end_date):
+    """Write the sentinel file for a finished date chunk"""
+    # The chunk ending today keeps receiving new patents, so it is never marked done
+    if end_date.date() >= datetime.now().date():
+        return
+    with open(chunk_done_path(start_date), "w"):
+        pass
+
+def load_done_chunks():
+    """Return the start dates (YYYYMMDD) of every finished date chunk"""
+    os.makedirs(PROGRESS_DIR, exist_ok=True)
+    return {name[:-len(".done")] for name in os.listdir(PROGRESS_DIR) if name.endswith(".done")}
 
 def load_progress():
-    """Load the last processed date"""
+    """Load the last processed date saved by the old sequential scraper"""
     try:
         with open("scraping_progress.txt", "r") as f:
             date_str = f.read().strip()
@@ -56,110 +85,122 @@ def load_progress():
         return datetime(1900, 1, 1)
         return datetime(1700, 1, 1)
 
-def construct_url(page_num, start_date, end_date):
-    formatted_start_date = start_date.strftime("%Y%m%d")
-    formatted_end_date = end_date.strftime("%Y%m%d")
-    return f"https://patents.google.com/?country=US&before=publication:{formatted_end_date}&after=publication:{formatted_start_date}&language=ENGLISH&type=PATENT&num={no_of_results}&dups=language&page={page_num}"
-
-# Setup Chrome options
-chrome_options = Options()
-chrome_options.add_argument("--headless")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--remote-debugging-port=9222")
-chrome_options.binary_location = "/snap/bin/chromium"  # Path to Chromium binary from snap
-
-def scrape_date_range(driver, start_date, end_date, existing_patents):
+def construct_query(start_date, end_date):
+    """Build the search query for a date range; the page number is appended per request"""
+    return "&".join([
+        "country=US",
+        "before=publication:" + end_date.strftime("%Y%m%d"),
+        "after=publication:" + start_date.strftime("%Y%m%d"),
+        "language=ENGLISH",
+        "type=PATENT",
+        "num=" + str(no_of_results),
+        "dups=language",
+    ])
+
+async def fetch_patent_numbers(client, query, page_num):
+    """Fetch one results page and return the patent numbers on it, in order"""
+    response = await client.get(SEARCH_API_URL, params={"url": f"{query}&page={page_num}", "exp": ""})
+    await asyncio.sleep(REQUEST_DELAY)
+    response.raise_for_status()
+
+    # Deduplicate while preserving order
+    seen = set()
+    patent_numbers = []
+    for cluster in response.json().get("results", {}).get("cluster", []):
+        for result in cluster.get("result", []):
+            # publication_number carries a kind code (e.g. US11890029B2), keep the bare number
+            match = PATENT_RE.match(result.get("patent", {}).get("publication_number", ""))
+            if match:
+                number = match.group()
+                if number not in seen:
+                    seen.add(number)
+                    patent_numbers.append(number)
+    return patent_numbers
+
+async def scrape_date_range(client, start_date, end_date, existing_patents):
     """Scrape patents for a specific date range"""
-    all_patent_links = []
+    all_new_patents = []
+    query = construct_query(start_date, end_date)
     page_num = 0
     max_retries = 3
 
     while True:
-        current_url = construct_url(page_num, start_date, end_date)
         print(f"\nFetching page {page_num + 1} for date range: {start_date.date()} to {end_date.date()}")
-        print(f"URL: {current_url}")
 
         for retry in range(max_retries):
             try:
-                driver.get(current_url)
-                time.sleep(15)  # Wait for content to load
-
-                html_content = driver.page_source
-                patent_numbers = re.findall(r"US\d{1,11}", html_content)
+                patent_numbers = await fetch_patent_numbers(client, query, page_num)
 
                 if not patent_numbers:
                     print(f"No more results found after page {page_num + 1}")
-                    return all_patent_links
+                    mark_chunk_done(start_date, end_date)
+                    return all_new_patents
 
-                patent_numbers = list(dict.fromkeys(patent_numbers))
-                patent_links = [f"https://patents.google.com/patent/{patent_number}" for patent_number in patent_numbers]
-                new_patents = [link for link in patent_links if link not in existing_patents]
+                new_patents = [n for n in patent_numbers if patent_key(n.encode()) not in existing_patents]
 
-                print(f"Patents found on page {page_num + 1}: {len(patent_links)}")
+                print(f"Patents found on page {page_num + 1}: {len(patent_numbers)}")
                 print(f"New patents found: {len(new_patents)}")
 
-                save_new_patents(new_patents, existing_patents)
-                existing_patents.update(new_patents)
-                all_patent_links.extend(new_patents)
+                save_new_patents(new_patents)
+                existing_patents.update(patent_key(n.encode()) for n in new_patents)
+                all_new_patents.extend(new_patents)
 
                 page_num += 1
-                time.sleep(15)  # Delay between pages
                 break  # Success, exit retry loop
 
             except Exception as e:
                 print(f"Error on attempt {retry + 1}/{max_retries}: {str(e)}")
                 if retry < max_retries - 1:
-                    print("Recreating WebDriver session...")
-                    try:
-                        driver.quit()
-                    except:
-                        pass
-
-                    # Reinitialize the driver
-                    driver = webdriver.Chrome(
-                        service=Service("/snap/chromium/current/usr/lib/chromium-browser/chromedriver"),
-                        options=chrome_options
-                    )
-                    time.sleep(5)  # Wait before retry
+                    await asyncio.sleep(5)  # Wait before retry
                 else:
                     print(f"Failed after {max_retries} attempts")
-                    return all_patent_links
+                    return all_new_patents
+
+    return all_new_patents
+
+async def scrape_worker(client, chunks, existing_patents):
+    """Scrape date chunks off the shared queue until it is empty"""
+    total_new_patents = 0
+    while not chunks.empty():
+        start_date, end_date = chunks.get_nowait()
+        print(f"\nProcessing date chunk: {start_date.date()} to {end_date.date()}")
+
+        # No lock needed around existing_patents: the filter/save/update sequence
+        # in scrape_date_range never awaits, so workers can't interleave inside it
+        new_patents = await scrape_date_range(client, start_date, end_date, existing_patents)
+        total_new_patents += len(new_patents)
+
+        print(f"Completed chunk. Total patents so far: {len(existing_patents)}")
+    return total_new_patents
 
-    return all_patent_links
+async def scrape_all(start_from, existing_patents):
+    """Scrape every unfinished date chunk with MAX_WORKERS concurrent workers"""
+    done_chunks = load_done_chunks()
+    chunks = asyncio.Queue()
+    for start_date, end_date in get_date_chunks():
+        if start_date >= start_from and start_date.strftime("%Y%m%d") not in done_chunks:
+            chunks.put_nowait((start_date, end_date))
+    print(f"Date chunks left to scrape: {chunks.qsize()}")
+
+    async with httpx.AsyncClient(http2=True, headers=HEADERS, timeout=30) as client:
+        results = await asyncio.gather(*(
+            scrape_worker(client, chunks, existing_patents) for _ in range(MAX_WORKERS)
+        ))
+    return sum(results)
 
 def getLinks():
+    total_new_patents = 0
+    existing_patents = set()
     while True:  # Main retry loop
         try:
-            # Initialize the driver
-            driver = webdriver.Chrome(
-                service=Service("/snap/chromium/current/usr/lib/chromium-browser/chromedriver"),
-                options=chrome_options
-            )
             existing_patents = load_existing_patents()
             print(f"Found {len(existing_patents)} existing patents in {PATENTS_FILE}")
 
-            # Load progress
+            # Load progress (chunks before the old sequential cursor are already done)
             start_from = load_progress()
             print(f"Resuming scraping from: {start_from.date()}")
 
-            total_new_patents = 0
-
-            for start_date, end_date in get_date_chunks():
-                if start_date < start_from:
-                    continue
-
-                print(f"\nProcessing date chunk: {start_date.date()} to {end_date.date()}")
-
-                new_patents = scrape_date_range(driver, start_date, end_date, existing_patents)
-                total_new_patents += len(new_patents)
-
-                # Save progress after each chunk
-                save_progress(end_date)
-
-                print(f"Completed chunk. Total patents so far: {len(existing_patents)}")
-                time.sleep(15)  # Delay between chunks
+            total_new_patents += asyncio.run(scrape_all(start_from, existing_patents))
 
             break  # Success, exit main retry loop
 
@@ -170,11 +211,6 @@ def getLinks():
             print(f"\nAn error occurred in main loop: {str(e)}")
             print("Waiting 60 seconds before retrying...")
             time.sleep(60)
-        finally:
-            try:
-                driver.quit()
-            except:
-                pass
 
     print(f"\nScraping completed or interrupted.")
     print(f"Total new patents found: {total_new_patents}")
@@ -182,4 +218,4 @@ def getLinks():
     return total_new_patents
 
 if __name__ == "__main__":
-    getLinks()
\ No newline at end of file
+    getLinks()
@@ -1,14 +1,20 @@
 from datetime import datetime, timedelta
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
+import asyncio
+import httpx
+import mmap
 import re
-import time
 from dotenv import load_dotenv
 import os
 import logging
 
+try:
+    import xxhash
+    def patent_key(patent_number: bytes) -> int:
+        return xxhash.xxh3_64_intdigest(patent_number)
+except ImportError:
+    def patent_key(patent_number: bytes) -> int:
+        return hash(patent_number)
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,10 +32,19 @@ load_dotenv()
 PATENTS_FILE = "patent_urls.txt"
 no_of_results = 100
 
-PAGE_LOAD_DELAY = 15  # Seconds to wait for page load
-BETWEEN_PAGES_DELAY = 10  # Seconds to wait between pages
+BETWEEN_PAGES_DELAY = 2  # Seconds to wait between pages
+RETRY_DELAY = 15  # Seconds to wait before retrying a failed page
 MAX_RETRIES = 3  # Maximum number of retries per page
 
+# Google Patents JSON search endpoint (same results as the search page, no JS rendering)
+SEARCH_API_URL = "https://patents.google.com/xhr/query"
+HEADERS = {
+    "User-Agent": os.getenv("USER_AGENT", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"),
+    "Accept": "application/json",
+}
+PATENT_RE = re.compile(r"US\d{1,11}")
+PATENT_URL_PREFIX = "https://patents.google.com/patent/"
+
 def get_date_range():
     # end_date = datetime.now()
     end_date = datetime.now() - timedelta(days=5)  # Exclude today
@@ -37,21 +52,28 @@ def get_date_range():
     return start_date, end_date
 
 def load_existing_patents():
-    if os.path.exists(PATENTS_FILE):
-        with open(PATENTS_FILE, 'r') as f:
-            return set(line.strip() for line in f)
-    return set()
-
-def save_new_patents(new_patents, existing_patents):
-    with open(PATENTS_FILE, 'a') as f:
-        for patent in new_patents:
-            if patent not in existing_patents:
-                f.write(f"{patent}\n")
-
-def construct_url(page_num, start_date, end_date):
-    formatted_start_date = start_date.strftime("%Y%m%d")
-    formatted_end_date = end_date.strftime("%Y%m%d")
-    return f"https://patents.google.com/?country=US&before=publication:{formatted_end_date}&after=publication:{formatted_start_date}&language=ENGLISH&type=PATENT&num={no_of_results}&dups=language&page={page_num}"
+    """Return 64-bit hashes of the patent numbers in PATENTS_FILE (8 bytes each instead of a str)"""
+    if not os.path.exists(PATENTS_FILE) or os.path.getsize(PATENTS_FILE) == 0:
+        return set()
+    with open(PATENTS_FILE, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return {patent_key(line.rstrip().rpartition(b"/")[2]) for line in iter(mm.readline, b"")}
+
+def save_new_patents(new_patents):
+    """Append patent URLs to PATENTS_FILE; callers pass only patent numbers not already saved"""
+    with open(PATENTS_FILE, 'a', buffering=1 << 16) as f:
+        f.writelines(f"{PATENT_URL_PREFIX}{patent_number}\n" for patent_number in new_patents)
+
+def construct_query(start_date, end_date):
+    """Build the search query for a date range; the page number is appended per request"""
+    return "&".join([
+        "country=US",
+        "before=publication:" + end_date.strftime("%Y%m%d"),
+        "after=publication:" + start_date.strftime("%Y%m%d"),
+        "language=ENGLISH",
+        "type=PATENT",
+        "num=" + str(no_of_results),
+        "dups=language",
+    ])
 
 def save_scraping_state(date, page_num):
     """Save the current scraping state"""
@@ -67,108 +89,101 @@ def load_scraping_state():
     except FileNotFoundError:
         return None, 0
 
-# Setup Chrome options
-chrome_options = Options()
-chrome_options.add_argument("--headless")
-chrome_options.add_argument("--no-sandbox")
-chrome_options.add_argument("--disable-dev-shm-usage")
-chrome_options.add_argument("--disable-gpu")
-chrome_options.add_argument("--remote-debugging-port=9222")
-chrome_options.binary_location = "/snap/bin/chromium"  # Path to Chromium binary from snap
+async def fetch_patent_numbers(client, query, page_num):
+    """Fetch one results page and return the patent numbers on it, in order"""
+    response = await client.get(SEARCH_API_URL, params={"url": f"{query}&page={page_num}", "exp": ""})
+    response.raise_for_status()
 
-def getLinks():
-    logging.info("Starting patent link collection process")
-    start_date, end_date = get_date_range()
-    logging.info(f"Scraping patents from {start_date.date()} to {end_date.date()}")
-    
-    # Initialize the driver with specific ChromeDriver path
-    driver = webdriver.Chrome(
-        service=Service("/snap/chromium/current/usr/lib/chromium-browser/chromedriver"),
-        options=chrome_options
-    )
-    all_patent_links = []
-    
-    # Load existing patents
-    existing_patents = load_existing_patents()
-    print(f"Found {len(existing_patents)} existing patents in {PATENTS_FILE}")
-    
-    # Load last state
-    last_date, page_num = load_scraping_state()
-    if last_date and last_date == start_date:
-        print(f"Resuming from page {page_num + 1}")
-    else:
-        page_num = 0
-    
-    try:
+    # Deduplicate while preserving order
+    seen = set()
+    patent_numbers = []
+    for cluster in response.json().get("results", {}).get("cluster", []):
+        for result in cluster.get("result", []):
+            # publication_number carries a kind code (e.g. US11890029B2), keep the bare number
+            match = PATENT_RE.match(result.get("patent", {}).get("publication_number", ""))
+            if match:
+                number = match.group()
+                if number not in seen:
+                    seen.add(number)
+                    patent_numbers.append(number)
+    return patent_numbers
+
+async def scrape_pages(start_date, end_date, page_num, existing_patents, all_new_patents):
+    query = construct_query(start_date, end_date)
+    async with httpx.AsyncClient(http2=True, headers=HEADERS, timeout=30) as client:
         while True:
-            # Load the page
-            current_url = construct_url(page_num, start_date, end_date)
             logging.info(f"Fetching page {page_num + 1}")
-            logging.debug(f"URL: {current_url}")
+            logging.debug(f"Query: {query}&page={page_num}")
             
             retry_count = 0
             while retry_count < MAX_RETRIES:
                 try:
-                    driver.get(current_url)
-                    time.sleep(PAGE_LOAD_DELAY)  # Wait for content to load
-                    
-                    # Get the page source after JavaScript execution
-                    html_content = driver.page_source
-                    
-                    # Use regex to find all patent numbers
-                    patent_numbers = re.findall(r"US\d{1,11}", html_content)
+                    patent_numbers = await fetch_patent_numbers(client, query, page_num)
                     break
                 except Exception as e:
                     retry_count += 1
                     print(f"Attempt {retry_count} failed: {str(e)}")
                     if retry_count == MAX_RETRIES:
                         raise
-                    time.sleep(PAGE_LOAD_DELAY)
+                    await asyncio.sleep(RETRY_DELAY)
             
             # If no patents found on the page, break the loop
             if not patent_numbers:
                 logging.info(f"No more results found after page {page_num + 1}")
                 break
             
-            # Remove duplicates while preserving order
-            patent_numbers = list(dict.fromkeys(patent_numbers))
-            
-            # Generate full URLs
-            patent_links = [f"https://patents.google.com/patent/{patent_number}" for patent_number in patent_numbers]
-            
             # Filter out already existing patents
-            new_patents = [link for link in patent_links if link not in existing_patents]
+            new_patents = [n for n in patent_numbers if patent_key(n.encode()) not in existing_patents]
             
-            # Print the extracted links for current page
-            logging.info(f"Patents found on page {page_num + 1}: {len(patent_links)}")
+            # Print the extracted patents for current page
+            logging.info(f"Patents found on page {page_num + 1}: {len(patent_numbers)}")
             logging.info(f"New patents found: {len(new_patents)}")
-            for i, link in enumerate(new_patents, 1):
-                logging.debug(f"{i}. {link}")
+            for i, patent_number in enumerate(new_patents, 1):
+                logging.debug(f"{i}. {patent_number}")
             
             # Save new patents to file
-            save_new_patents(new_patents, existing_patents)
-            existing_patents.update(new_patents)
+            save_new_patents(new_patents)
+            existing_patents.update(patent_key(n.encode()) for n in new_patents)
             
             # Add to master list
-            all_patent_links.extend(new_patents)  # Only extend with new patents
+            all_new_patents.extend(new_patents)  # Only extend with new patents
             
             # Save current state
             save_scraping_state(start_date, page_num)
             
             # Move to next page with increased delay
             page_num += 1
-            time.sleep(BETWEEN_PAGES_DELAY)
-            
+            await asyncio.sleep(BETWEEN_PAGES_DELAY)
+
+def getLinks():
+    logging.info("Starting patent link collection process")
+    start_date, end_date = get_date_range()
+    logging.info(f"Scraping patents from {start_date.date()} to {end_date.date()}")
+    
+    all_new_patents = []
+    
+    # Load existing patents
+    existing_patents = load_existing_patents()
+    print(f"Found {len(existing_patents)} existing patents in {PATENTS_FILE}")
+    
+    # Load last state
+    last_date, page_num = load_scraping_state()
+    if last_date and last_date == start_date:
+        print(f"Resuming from page {page_num + 1}")
+    else:
+        page_num = 0
+    
+    try:
+        asyncio.run(scrape_pages(start_date, end_date, page_num, existing_patents, all_new_patents))
     except KeyboardInterrupt:
         print("\nScraping interrupted by user. Progress has been saved.")
     except Exception as e:
         print(f"\nAn error occurred: {str(e)}")
     finally:
-        driver.quit()
         print(f"\nScraping completed or interrupted.")
-        print(f"Total new patents found: {len(all_patent_links)}")
+        print(f"Total new patents found: {len(all_new_patents)}")
         print(f"Total unique patents in {PATENTS_FILE}: {len(existing_patents)}")
-        return all_patent_links
+        return all_new_patents
 
 if __name__ == "__main__":
     getLinks()
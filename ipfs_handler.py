@@ -1,21 +1,64 @@
 import requests
+import aiohttp
+import asyncio
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import contextlib
+import hashlib
+import gzip
+import sqlite3
+import threading
 import json
+import orjson
 import os
-from typing import Dict, Any
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
 import logging
 from datetime import datetime
 
-class IPFSHandler:
+# Local copies are kept gzip compressed, IPFS gets the plain JSON
+LOCAL_COMPRESSLEVEL = 3
+
+class IPFSHandler(contextlib.AbstractContextManager):
     def __init__(self, ipfs_api_url: str = "http://127.0.0.1:5001/api/v0"):
         self.ipfs_api_url = ipfs_api_url
+        # Reuse keep-alive connections to the IPFS API across calls
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=64,
+            max_retries=Retry(total=3, backoff_factor=0.2)
+        ))
         self.output_dir = "patent_json"
         # Create output directory if it doesn't exist
         os.makedirs(self.output_dir, exist_ok=True)
         self.logger = self._setup_logger()
+
+        # patent number -> final IPFS hash of the uploaded file, the sha256 of the
+        # formatted content it was built from and the hash embedded in the payload
+        self._cid_lock = threading.Lock()
+        self.cid_index = sqlite3.connect(os.path.join(self.output_dir, "cids.sqlite3"), check_same_thread=False)
+        self.cid_index.execute(
+            "CREATE TABLE IF NOT EXISTS cids (patent_number TEXT PRIMARY KEY, cid TEXT NOT NULL, "
+            "content_sha256 TEXT, embedded_hash TEXT)"
+        )
+        # Indexes created before the content columns existed, their rows miss the cache once
+        columns = {row[1] for row in self.cid_index.execute("PRAGMA table_info(cids)")}
+        for column in ("content_sha256", "embedded_hash"):
+            if column not in columns:
+                self.cid_index.execute(f"ALTER TABLE cids ADD COLUMN {column} TEXT")
         
         # Initialize MFS directory structure
         self.init_mfs_directory()
 
+    def close(self):
+        """Close the pooled connections to the IPFS API and the hash index"""
+        self.session.close()
+        self.cid_index.close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def _setup_logger(self):
         logging.basicConfig(
             level=logging.INFO,
@@ -28,7 +71,7 @@ class IPFSHandler:
         """Initialize the MFS directory structure"""
         try:
             # Create /patents directory if it doesn't exist
-            mkdir_response = requests.post(
+            mkdir_response = self.session.post(
                 f"{self.ipfs_api_url}/files/mkdir",
                 params={
                     'arg': '/patents',
@@ -50,8 +93,8 @@ class IPFSHandler:
         Add data to IPFS and return the hash
         """
         try:
-            # Convert data to JSON string
-            json_data = json.dumps(data)
+            # Convert data to JSON
+            json_data = orjson.dumps(data)
             
             # Prepare the file for IPFS
             files = {
@@ -59,7 +102,7 @@ class IPFSHandler:
             }
             
             # Add to IPFS
-            response = requests.post(
+            response = self.session.post(
                 f"{self.ipfs_api_url}/add",
                 files=files
             )
@@ -81,7 +124,7 @@ class IPFSHandler:
         Retrieve data from IPFS using the hash
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.ipfs_api_url}/cat",
                 params={'arg': ipfs_hash}
             )
@@ -96,126 +139,196 @@ class IPFSHandler:
             self.logger.error(f"Error getting from IPFS: {str(e)}")
             return {}
 
-    def save_and_upload(self, patent_data: Dict[str, Any], patent_number: str) -> str:
+    def _format_patent(self, patent_data: Dict[str, Any], patent_number: str) -> Dict[str, Any]:
+        """Format the data according to the required structure"""
+        return {
+            "patent_title": patent_data.get('patent_title', ''),
+            "abstract": patent_data.get('abstract', ''),
+            "inventions": patent_data.get('inventions', []),
+            "publication_number": patent_number,
+            "filing_date": patent_data.get('filing_date', ''),
+            "assignee_name": patent_data.get('assignee_name', ''),
+            "inventor_name": patent_data.get('inventor_name', ''),
+            "patent_url": patent_data.get('patent_url', ''),
+            "patent_text": patent_data.get('patent_text', '')
+        }
+
+    def _add_files(self, payloads: Dict[str, bytes], only_hash: bool = False) -> Dict[str, str]:
         """
-        Save patent data as JSON and upload to IPFS
+        Add several serialized JSON documents in one multipart /add request.
+        Returns a mapping of patent number to IPFS hash.
         """
-        try:
-            # Format the data according to the required structure
-            formatted_data = {
-                "patent_title": patent_data.get('patent_title', ''),
-                "abstract": patent_data.get('abstract', ''),
-                "inventions": patent_data.get('inventions', []),
-                "publication_number": patent_number,
-                "filing_date": patent_data.get('filing_date', ''),
-                "assignee_name": patent_data.get('assignee_name', ''),
-                "inventor_name": patent_data.get('inventor_name', ''),
-                "patent_url": patent_data.get('patent_url', ''),
-                "patent_text": patent_data.get('patent_text', '')
-            }
+        files = [
+            ('file', (f"{patent_number}.json", payload))
+            for patent_number, payload in payloads.items()
+        ]
+        response = self.session.post(f"{self.ipfs_api_url}/add", params=self._add_params(only_hash), files=files)
+        if response.status_code != 200:
+            self.logger.error(f"Failed to add to IPFS: {response.text}")
+            return {}
+        return self._parse_add_response(response.text)
 
-            # First upload to get the hash
-            files = {
-                'file': ('patent.json', json.dumps(formatted_data, indent=2))
-            }
-            
-            # Add to IPFS first time to get hash
-            response = requests.post(
-                f"{self.ipfs_api_url}/add",
-                files=files
-            )
-            
-            if response.status_code == 200:
-                ipfs_hash = response.json()['Hash']
-                
-                # Add the hash to the formatted data
-                formatted_data["ipfs_hash"] = ipfs_hash
-                
-                # Upload again with the hash included
-                files_with_hash = {
-                    'file': ('patent.json', json.dumps(formatted_data, indent=2))
-                }
-                
-                final_response = requests.post(
-                    f"{self.ipfs_api_url}/add",
-                    files=files_with_hash
-                )
-                
-                if final_response.status_code == 200:
-                    final_hash = final_response.json()['Hash']
-                    
-                    # Save locally
-                    json_path = os.path.join(self.output_dir, f"{patent_number}.json")
-                    with open(json_path, 'w', encoding='utf-8') as f:
-                        json.dump(formatted_data, f, indent=2, ensure_ascii=False)
-                    
-                    # Pin the file
-                    pin_response = requests.post(
-                        f"{self.ipfs_api_url}/pin/add",
-                        params={'arg': final_hash}
-                    )
-                    
-                    # Add to MFS (this will make it visible in WebUI)
-                    mfs_path = f"/patents/{patent_number}.json"
-                    
-                    # First ensure the file doesn't already exist
-                    try:
-                        requests.post(
-                            f"{self.ipfs_api_url}/files/rm",
-                            params={'arg': mfs_path, 'force': 'true'}
-                        )
-                    except:
-                        pass  # Ignore if file doesn't exist
-                    
-                    # Write to MFS using files/write
-                    try:
-                        json_content = json.dumps(formatted_data, indent=2)
-                        
-                            # Try alternative method using files/cp
-                        print("Trying alternative upload method...")
-                        cp_response = requests.post(
-                            f"{self.ipfs_api_url}/files/cp",
-                            params=[
-                                ('arg', f"/ipfs/{final_hash}"),
-                                ('arg', mfs_path)
-                            ]
-                        )
-                        
-                        if cp_response.status_code == 200:
-                            print("Successfully added using alternative method")
-                        else:
-                            print(f"Alternative method also failed: {cp_response.text}")
-                    
-                    except Exception as e:
-                        self.logger.error(f"Error writing to MFS: {str(e)}")
-                        print(f"Error during MFS write: {str(e)}")
-                    
-                    # Verify the file exists in MFS
-                    verify_response = requests.post(
-                        f"{self.ipfs_api_url}/files/stat",
-                        params={'arg': mfs_path}
-                    )
-                    
-                    if verify_response.status_code == 200:
-                        print(f"Verified file in MFS: {mfs_path}")
-                        print("File details:", verify_response.json())
-                    else:
-                        print(f"Could not verify file in MFS: {mfs_path}")
-                        print("Verification error:", verify_response.text)
-                    
-                    self.verify_ipfs_upload(final_hash)
-                    return final_hash
-                
-            return ""
+    @staticmethod
+    def _add_params(only_hash: bool) -> Dict[str, str]:
+        params = {'wrap-with-directory': 'false'}
+        if only_hash:
+            params['only-hash'] = 'true'
+        else:
+            params['pin'] = 'true'
+        return params
+
+    @staticmethod
+    def _parse_add_response(text: str) -> Dict[str, str]:
+        """Map patent numbers to hashes, /add returns one JSON object per file per line"""
+        hashes = {}
+        for line in text.splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                hashes[entry['Name'][:-len(".json")]] = entry['Hash']
+        return hashes
 
+    def flush_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, str]:
+        """
+        Save a batch of (patent_number, patent_data) as JSON and upload them to IPFS
+        using one request per stage instead of one per patent.
+        Returns a mapping of patent number to IPFS hash for the successful uploads.
+        """
+        if not batch:
+            return {}
+
+        documents, contents, uploaded = self._prepare_batch(batch)
+        if not documents:
+            return uploaded
+
+        try:
+            # Compute the hashes without storing anything (only-hash)
+            ipfs_hashes = self._add_files(contents, only_hash=True)
+            payloads = self._embed_hashes(documents, ipfs_hashes)
+
+            # Single real upload, with the hashes included
+            final_hashes = self._add_files(payloads)
         except Exception as e:
-            self.logger.error(f"Error in save_and_upload: {str(e)}")
+            self.logger.error(f"Error in flush_batch: {str(e)}")
             print(f"Upload error: {str(e)}")
-            return ""
+            return uploaded
+
+        for patent_number, final_hash in final_hashes.items():
+            try:
+                self._save_and_link(
+                    payloads[patent_number], patent_number, final_hash,
+                    self._content_hash(contents[patent_number]), documents[patent_number]["ipfs_hash"]
+                )
+                uploaded[patent_number] = final_hash
+            except Exception as e:
+                self.logger.error(f"Error saving patent {patent_number}: {str(e)}")
+                print(f"Upload error: {str(e)}")
+        return uploaded
+
+    def _prepare_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, bytes], Dict[str, str]]:
+        """
+        Format a batch for upload. Returns the documents that need uploading, their
+        serialized content (without ipfs_hash) and the hashes of the patents that
+        are already stored unchanged.
+        """
+        documents, contents, uploaded = {}, {}, {}
+        for patent_number, patent_data in batch:
+            formatted_data = self._format_patent(patent_data, patent_number)
+            content = orjson.dumps(formatted_data)
+            cached = self._cached_hash(patent_number, self._content_hash(content))
+            if cached:
+                cached_hash, embedded_hash = cached
+                self.logger.info(f"Patent {patent_number} unchanged, reusing hash: {cached_hash}")
+                # The local copy may have been rewritten since, restore the uploaded payload
+                self._write_local(orjson.dumps({**formatted_data, "ipfs_hash": embedded_hash}), patent_number)
+                uploaded[patent_number] = cached_hash
+            else:
+                documents[patent_number] = formatted_data
+                contents[patent_number] = content
+        return documents, contents, uploaded
+
+    @staticmethod
+    def _embed_hashes(documents: Dict[str, Dict[str, Any]], ipfs_hashes: Dict[str, str]) -> Dict[str, bytes]:
+        """
+        Add the hash to the formatted data. The compact payload is serialized
+        once and reused for both the upload and the local copy.
+        """
+        payloads = {}
+        for patent_number, ipfs_hash in ipfs_hashes.items():
+            documents[patent_number]["ipfs_hash"] = ipfs_hash
+            payloads[patent_number] = orjson.dumps(documents[patent_number])
+        return payloads
+
+    def _local_path(self, patent_number: str) -> str:
+        return os.path.join(self.output_dir, f"{patent_number}.json.gz")
+
+    def _write_local(self, payload: bytes, patent_number: str):
+        Path(self._local_path(patent_number)).write_bytes(gzip.compress(payload, LOCAL_COMPRESSLEVEL))
+
+    @staticmethod
+    def _content_hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def _record_cid(self, patent_number: str, final_hash: str, content_sha256: str, embedded_hash: str):
+        with self._cid_lock, self.cid_index:
+            self.cid_index.execute(
+                "INSERT OR REPLACE INTO cids (patent_number, cid, content_sha256, embedded_hash) VALUES (?, ?, ?, ?)",
+                (patent_number, final_hash, content_sha256, embedded_hash)
+            )
+
+    def _cached_hash(self, patent_number: str, content_sha256: str) -> Optional[Tuple[str, str]]:
+        """
+        Return (IPFS hash, embedded hash) of an earlier upload if it was built from
+        the same content, so unchanged patents are not uploaded again
+        """
+        with self._cid_lock:
+            row = self.cid_index.execute(
+                "SELECT cid, embedded_hash FROM cids WHERE patent_number = ? AND content_sha256 = ?",
+                (patent_number, content_sha256)
+            ).fetchone()
+        if not row or not row[1]:
+            return None
+        return row[0], row[1]
+
+    def save_and_upload(self, patent_data: Dict[str, Any], patent_number: str) -> str:
+        """
+        Save patent data as JSON and upload to IPFS
+        """
+        return self.flush_batch([(patent_number, patent_data)]).get(patent_number, "")
+
+    def _save_and_link(self, payload: bytes, patent_number: str, final_hash: str, content_sha256: str, embedded_hash: str):
+        """Save an uploaded (already pinned) patent locally and add it to MFS"""
+        # Save locally, decompresses byte-identical to the IPFS copy
+        self._write_local(payload, patent_number)
+        
+        # Add to MFS (this will make it visible in WebUI)
+        mfs_path = f"/patents/{patent_number}.json"
+        cp_params = [
+            ('arg', f"/ipfs/{final_hash}"),
+            ('arg', mfs_path),
+            ('parents', 'true')
+        ]
+        cp_response = self.session.post(f"{self.ipfs_api_url}/files/cp", params=cp_params)
+        
+        if cp_response.status_code != 200:
+            # files/cp refuses to overwrite, replace the existing entry
+            self.session.post(
+                f"{self.ipfs_api_url}/files/rm",
+                params={'arg': mfs_path, 'force': 'true'}
+            )
+            cp_response = self.session.post(f"{self.ipfs_api_url}/files/cp", params=cp_params)
+        
+        if cp_response.status_code == 200:
+            self._record_cid(patent_number, final_hash, content_sha256, embedded_hash)
+            self.logger.info(f"Added {mfs_path} with hash: {final_hash}")
+            print(f"Added to IPFS: {mfs_path} (http://127.0.0.1:8080/ipfs/{final_hash})")
+        else:
+            self.logger.error(f"Error writing to MFS: {cp_response.text}")
+            print(f"Error during MFS write: {cp_response.text}")
 
     def verify_ipfs_upload(self, ipfs_hash: str) -> bool:
         """
-        Verify that a file was successfully uploaded to IPFS
+        Verify that a file was successfully uploaded to IPFS.
+        Debugging helper, not called on the upload path.
         """
         try:
             # Try to retrieve the file from IPFS
@@ -231,10 +344,10 @@ class IPFSHandler:
                 print(f"4. WebUI: Files/patents/{data.get('publication_number', 'unknown')}.json")
                 
                 # # Verify the file is pinned and in MFS
-                # pin_check = requests.post(f"{self.ipfs_api_url}/pin/ls", 
-                #                         params={'arg': ipfs_hash})
-                mfs_check = requests.post(f"{self.ipfs_api_url}/files/ls",
-                                        params={'arg': '/patents'})
+                # pin_check = self.session.post(f"{self.ipfs_api_url}/pin/ls", 
+                #                              params={'arg': ipfs_hash})
+                mfs_check = self.session.post(f"{self.ipfs_api_url}/files/ls",
+                                              params={'arg': '/patents'})
                 
                 # if pin_check.status_code == 200:
                 #     print("\nFile is pinned locally")
@@ -251,11 +364,145 @@ class IPFSHandler:
         """Verify file exists in MFS"""
         try:
             mfs_path = f"/patents/{patent_number}.json"
-            response = requests.post(
+            response = self.session.post(
                 f"{self.ipfs_api_url}/files/stat",
                 params={'arg': mfs_path}
             )
             return response.status_code == 200
         except Exception as e:
             self.logger.error(f"Error verifying MFS file: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+
+class AsyncIPFSHandler(IPFSHandler):
+    """
+    asyncio variant of the upload path using aiohttp, so many patents can be
+    uploaded to the local IPFS daemon concurrently. Use inside `async with`.
+    """
+
+    def __init__(self, ipfs_api_url: str = "http://127.0.0.1:5001/api/v0", concurrency: int = 16):
+        super().__init__(ipfs_api_url)
+        self.concurrency = concurrency
+        self._aiohttp_session = None
+
+    def init_mfs_directory(self):
+        """Done through aiohttp in __aenter__, the blocking version would stall the event loop"""
+
+    async def init_mfs_directory_async(self):
+        """Async version of init_mfs_directory"""
+        try:
+            status, text = await self._post("files/mkdir", {'arg': '/patents', 'parents': 'true'})
+            if status == 200:
+                self.logger.info("MFS patents directory initialized")
+                print("IPFS patents directory ready")
+            else:
+                self.logger.warning(f"Failed to create MFS directory: {text}")
+                print("Failed to initialize IPFS directory structure")
+        except Exception as e:
+            self.logger.error(f"Error initializing MFS directory: {str(e)}")
+            print(f"Error setting up IPFS directory structure")
+
+    async def __aenter__(self):
+        self._aiohttp_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=64))
+        await self.init_mfs_directory_async()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the aiohttp session along with the synchronous resources"""
+        if self._aiohttp_session is not None:
+            await self._aiohttp_session.close()
+            self._aiohttp_session = None
+        self.close()
+
+    async def _post(self, endpoint: str, params, data=None) -> Tuple[int, str]:
+        async with self._aiohttp_session.post(f"{self.ipfs_api_url}/{endpoint}", params=params, data=data) as response:
+            return response.status, await response.text()
+
+    async def _add_files_async(self, payloads: Dict[str, bytes], only_hash: bool = False) -> Dict[str, str]:
+        """Async version of _add_files"""
+        form = aiohttp.FormData()
+        for patent_number, payload in payloads.items():
+            form.add_field('file', payload, filename=f"{patent_number}.json", content_type='application/json')
+
+        status, text = await self._post("add", self._add_params(only_hash), form)
+        if status != 200:
+            self.logger.error(f"Failed to add to IPFS: {text}")
+            return {}
+        return self._parse_add_response(text)
+
+    async def _save_and_link_async(self, payload: bytes, patent_number: str, final_hash: str, content_sha256: str, embedded_hash: str):
+        """Async version of _save_and_link"""
+        # Disk and sqlite work runs in a thread so it doesn't stall the event loop
+        await asyncio.to_thread(self._write_local, payload, patent_number)
+
+        mfs_path = f"/patents/{patent_number}.json"
+        cp_params = [
+            ('arg', f"/ipfs/{final_hash}"),
+            ('arg', mfs_path),
+            ('parents', 'true')
+        ]
+        status, text = await self._post("files/cp", cp_params)
+        if status != 200:
+            # files/cp refuses to overwrite, replace the existing entry
+            await self._post("files/rm", {'arg': mfs_path, 'force': 'true'})
+            status, text = await self._post("files/cp", cp_params)
+
+        if status == 200:
+            await asyncio.to_thread(self._record_cid, patent_number, final_hash, content_sha256, embedded_hash)
+            self.logger.info(f"Added {mfs_path} with hash: {final_hash}")
+            print(f"Added to IPFS: {mfs_path} (http://127.0.0.1:8080/ipfs/{final_hash})")
+        else:
+            self.logger.error(f"Error writing to MFS: {text}")
+            print(f"Error during MFS write: {text}")
+
+    async def upload_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, str]:
+        """Async version of flush_batch"""
+        documents, contents, uploaded = await asyncio.to_thread(self._prepare_batch, batch)
+        if not documents:
+            return uploaded
+
+        try:
+            ipfs_hashes = await self._add_files_async(contents, only_hash=True)
+            payloads = self._embed_hashes(documents, ipfs_hashes)
+            final_hashes = await self._add_files_async(payloads)
+        except Exception as e:
+            self.logger.error(f"Error in upload_batch: {str(e)}")
+            print(f"Upload error: {str(e)}")
+            return uploaded
+
+        # Link the files into MFS concurrently, each one is an independent request
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def link(patent_number, final_hash):
+            async with semaphore:
+                try:
+                    await self._save_and_link_async(
+                        payloads[patent_number], patent_number, final_hash,
+                        self._content_hash(contents[patent_number]), documents[patent_number]["ipfs_hash"]
+                    )
+                    uploaded[patent_number] = final_hash
+                except Exception as e:
+                    self.logger.error(f"Error saving patent {patent_number}: {str(e)}")
+                    print(f"Upload error: {str(e)}")
+
+        await asyncio.gather(*(link(pn, final_hash) for pn, final_hash in final_hashes.items()))
+        return uploaded
+
+    async def run(self, patents: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, str]:
+        """
+        Upload (patent_number, patent_data) pairs with up to `concurrency`
+        uploads in flight. Returns patent number -> IPFS hash for the successes.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bound(patent):
+            async with semaphore:
+                return await self.upload_batch([patent])
+
+        uploaded = {}
+        for result in await asyncio.gather(*(bound(patent) for patent in patents)):
+            uploaded.update(result)
+        return uploaded
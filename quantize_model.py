@@ -0,0 +1,27 @@
+import subprocess
+import sys
+from onnxruntime.quantization import quantize_dynamic, QuantType
+
+# Export all-MiniLM-L6-v2 to ONNX and dynamically quantize its weights to int8.
+# The resulting model_int8.onnx is picked up by app.py for query encoding.
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EXPORT_DIR = "onnx_minilm"
+QUANTIZED_MODEL = "model_int8.onnx"
+
+def main():
+    print(f"Exporting {MODEL_NAME} to {EXPORT_DIR}/ ...")
+    subprocess.run(
+        ["optimum-cli", "export", "onnx", "--model", MODEL_NAME, EXPORT_DIR],
+        check=True
+    )
+
+    print(f"Quantizing {EXPORT_DIR}/model.onnx to {QUANTIZED_MODEL} ...")
+    quantize_dynamic(
+        f"{EXPORT_DIR}/model.onnx",
+        QUANTIZED_MODEL,
+        weight_type=QuantType.QInt8
+    )
+    print("Done")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import schedule
 import time
 import subprocess
+import requests
 import sys
 from datetime import datetime
 import logging
@@ -22,6 +23,28 @@ load_dotenv()
 if not os.getenv('USER_AGENT'):
     os.environ['USER_AGENT'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 
+IPFS_API_URL = "http://127.0.0.1:5001/api/v0"
+IPFS_STARTUP_TIMEOUT = 60  # Max seconds to wait for a freshly started daemon
+
+def ipfs_daemon_running():
+    """Check the IPFS API directly instead of spawning `ipfs id`"""
+    try:
+        # The kubo RPC API only accepts POST
+        return requests.post(f"{IPFS_API_URL}/id", timeout=1).status_code == 200
+    except requests.RequestException:
+        return False
+
+def wait_for_ipfs_daemon(timeout=IPFS_STARTUP_TIMEOUT):
+    """Poll the IPFS API with exponential backoff until it answers or timeout expires"""
+    deadline = time.monotonic() + timeout
+    delay = 0.5
+    while time.monotonic() < deadline:
+        if ipfs_daemon_running():
+            return True
+        time.sleep(min(delay, max(0, deadline - time.monotonic())))
+        delay = min(delay * 2, 8)
+    return ipfs_daemon_running()
+
 def run_process_with_output(command, env=None):
     """Run a process and show output in real-time"""
     process = subprocess.Popen(
@@ -34,14 +57,12 @@ def run_process_with_output(command, env=None):
         env=env
     )
     
-    while True:
-        output = process.stdout.readline()
-        if output:
-            print(output.strip())
-            logging.info(output.strip())
-        if process.poll() is not None:
-            break
+    # readline blocks until a line arrives and returns '' at EOF
+    for output in iter(process.stdout.readline, ''):
+        print(output.strip())
+        logging.info(output.strip())
     
+    process.wait()
     return process.returncode
 
 def run_scraper():
@@ -52,12 +73,14 @@ def run_scraper():
         print(f"{'='*50}\n")
         
         # Check if IPFS daemon is running
-        ipfs_check = subprocess.run(['ipfs', 'id'], capture_output=True)
-        if ipfs_check.returncode != 0:
+        if not ipfs_daemon_running():
             logging.error("IPFS daemon not running. Starting daemon...")
             print("IPFS daemon not running. Starting daemon...")
             subprocess.Popen(['ipfs', 'daemon'])
-            time.sleep(30)  # Wait for daemon to start
+            # Wait for daemon to start
+            if not wait_for_ipfs_daemon():
+                logging.error("IPFS daemon did not come up within the startup timeout")
+                print("IPFS daemon did not come up within the startup timeout")
         
         # Run getlinks_final.py with real-time output
         print("\nRunning getlinks_final.py to fetch new patents...")
@@ -106,12 +129,15 @@ def main():
     # Run immediately on start
     run_scraper()
     
-    # Keep the script running and show next run time
+    # Sleep until the next scheduled run instead of waking up every minute
     while True:
-        next_run = schedule.next_run()
-        print(f"\rNext run scheduled for: {next_run}", end='', flush=True)
+        idle = schedule.idle_seconds()
+        if idle is None:
+            break  # No jobs left
+        if idle > 0:
+            print(f"\rNext run scheduled for: {schedule.next_run()}", end='', flush=True)
+            time.sleep(idle)
         schedule.run_pending()
-        time.sleep(60)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,29 +1,36 @@
 import logging
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from langchain.output_parsers import PydanticOutputParser
-from pydantic import BaseModel, Field
-from langchain_core.documents import Document
-import json
+import orjson
+import gzip
+from pathlib import Path
 from dotenv import load_dotenv
 import os
-from ipfs_handler import IPFSHandler
+from ipfs_handler import IPFSHandler, AsyncIPFSHandler
 from typing import Dict, List
 import time
 import pandas as pd
 # from getlinks import getLinks
 import re
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
 import html2text
 import asyncio
-import chromadb
+import contextlib
+import functools
+import collections
+import threading
+from chroma_config import CHROMA_PATH, COLLECTION_NAME, COLLECTION_METADATA
 import uuid
-from sentence_transformers import SentenceTransformer
+from embedding_model import load_model, model_name, EmbeddingCache, find_uncached_texts
+import numpy as np
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 # from send_to_api import send_json_to_api  # Comment out or remove this line
 
 # Setup logging
@@ -36,12 +43,44 @@ logging.basicConfig(
     ]
 )
 
-# Initialize SentenceTransformer model
-model = SentenceTransformer("all-MiniLM-L6-v2")
+PAGE_LOAD_TIMEOUT = 15  # Max seconds to wait for patent content to appear
+IPFS_BATCH_SIZE = 64  # Patents per IPFS add request
+EMBEDDING_BATCH_SIZE = 32  # Max documents per model.encode / ChromaDB add call
+PERSIST_QUEUE_SIZE = 4  # Embedded batches waiting to be written
+MAX_CONCURRENT_PATENTS = 8  # Patent URLs processed in parallel
+REQUEST_DELAY = 2  # Seconds each worker waits after a patent (rate limiting)
+BROWSER_POOL_SIZE = 4  # Chromium instances shared by the workers
+RECYCLE_AFTER = 100  # Restart a browser after this many pages
 
-# Define a Pydantic model for structured output
-class PatentInfo(BaseModel):
-    inventions: List[str] = Field(description="List of inventions claimed in the patent")
+# Publication number in a Google Patents URL, e.g. /patent/US11234567B2/en
+PATENT_URL_RE = re.compile(r"/patent/([A-Z0-9]+)")
+# Whitespace around line breaks, collapsing it drops blank lines and indentation
+LINE_BREAKS_RE = re.compile(r" *\n\s*")
+WHITESPACE_RE = re.compile(r"\s+")
+SPACES_RE = re.compile(r" {2,}")
+
+# Elements that start a new line in patent_text, everything else (figref, sub, b, a, ...) stays inline
+BLOCK_TAGS = frozenset([
+    'address', 'article', 'aside', 'blockquote', 'br', 'caption', 'dd', 'div', 'dl', 'dt',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'tbody',
+    'thead', 'tfoot', 'tr', 'ul',
+])
+CELL_TAGS = frozenset(['td', 'th'])
+
+embedding_cache = EmbeddingCache()
+
+@functools.cache
+def get_model():
+    """Embedding model (same one app.py uses for queries), loaded on first use"""
+    return load_model()
+
+@functools.cache
+def get_collection():
+    """ChromaDB collection, opened once on first use and shared by every batch"""
+    import chromadb
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    return client.get_or_create_collection(COLLECTION_NAME, metadata=COLLECTION_METADATA, embedding_function=None)
 
 # Load environment variables at the top of the file
 load_dotenv()
@@ -97,68 +136,237 @@ class PatentScraper:
         
         return pd.DataFrame(all_patents)
 
-def clean_html_content(url: str) -> Dict:
+CHROMEDRIVER_PATH = "/snap/chromium/current/usr/lib/chromium-browser/chromedriver"
+
+# Setup Chrome options for Linux
+chrome_options = Options()
+chrome_options.add_argument("--headless")
+chrome_options.add_argument("--no-sandbox")
+chrome_options.add_argument("--disable-dev-shm-usage")
+chrome_options.add_argument("--disable-gpu")
+chrome_options.binary_location = "/snap/bin/chromium"  # Linux Chromium path
+
+# Only the HTML is needed, don't download images, stylesheets or fonts
+chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+chrome_options.add_experimental_option("prefs", {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.managed_default_content_settings.stylesheets": 2,
+    "profile.managed_default_content_settings.fonts": 2,
+})
+
+def new_driver():
+    """Start a headless Chromium with the shared options"""
+    # A Service owns a single chromedriver process, so each driver gets its own
+    return webdriver.Chrome(service=Service(CHROMEDRIVER_PATH), options=chrome_options)
+
+class BrowserPool:
     """
-    Fetch and extract content from HTML elements
-    Returns a dictionary with all patent information except claims
+    Pool of headless Chromium drivers reused across URLs instead of launching
+    a browser per page. Drivers are started on demand up to `size` and
+    restarted after `recycle_after` uses to keep native memory in check.
     """
-    try:
-        # Setup Chrome options for Linux
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--remote-debugging-port=9222")
-        chrome_options.binary_location = "/snap/bin/chromium"  # Linux Chromium path
-
-        # Initialize the driver with Linux ChromeDriver path
-        driver = webdriver.Chrome(
-            service=Service("/snap/chromium/current/usr/lib/chromium-browser/chromedriver"),
-            options=chrome_options
-        )
-        
-        logging.info(f"Fetching content from URL: {url}")
+
+    def __init__(self, size: int, recycle_after: int):
+        self.size = size
+        self.recycle_after = recycle_after
+        self._idle = collections.deque()
+        self._started = 0
+        # Waiters wake up when a driver is returned or discarded (freeing a slot)
+        self._cond = threading.Condition()
+
+    def _checkout(self):
+        with self._cond:
+            while not self._idle and self._started >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.popleft()
+            self._started += 1
+        try:
+            return new_driver(), 0
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._cond:
+            self._started -= 1
+            self._cond.notify()
+
+    def _return(self, driver, uses):
+        with self._cond:
+            self._idle.append((driver, uses))
+            self._cond.notify()
+
+    def _discard(self, driver):
+        self._release_slot()
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @contextlib.contextmanager
+    def acquire(self):
+        driver, uses = self._checkout()
+        try:
+            yield driver
+        except Exception:
+            # The driver may be in a bad state, replace it
+            self._discard(driver)
+            raise
+
+        uses += 1
+        if uses >= self.recycle_after:
+            self._discard(driver)
+            return
+        try:
+            driver.delete_all_cookies()
+        except Exception:
+            self._discard(driver)
+            return
+        self._return(driver, uses)
+
+    def close(self):
+        """Quit all idle drivers"""
+        while True:
+            with self._cond:
+                if not self._idle:
+                    break
+                driver, _ = self._idle.popleft()
+            self._discard(driver)
+
+browser_pool = BrowserPool(BROWSER_POOL_SIZE, RECYCLE_AFTER)
+
+# Keep-alive HTTP session for fetching patent pages
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+def fetch_patent_html(url: str) -> str:
+    """Fetch a patent page over plain HTTP, Google Patents renders the metadata server side"""
+    response = SESSION.get(url, headers={'User-Agent': os.getenv('USER_AGENT', DEFAULT_USER_AGENT)}, timeout=20)
+    response.raise_for_status()
+    return response.text
+
+def fetch_patent_html_with_browser(url: str) -> str:
+    """Fetch a patent page with a pooled browser, for pages that need JavaScript"""
+    with browser_pool.acquire() as driver:
         driver.get(url)
-        response_text = driver.page_source
-        driver.quit()
-        
-        # Parse HTML
-        soup = BeautifulSoup(response_text, 'html.parser')
-        
-        # Create HTML 2 text convertor for patent_text
+        try:
+            # Wait for the patent metadata to be present instead of a fixed delay
+            WebDriverWait(driver, PAGE_LOAD_TIMEOUT).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "span[itemprop='title']"))
+            )
+        except TimeoutException:
+            logging.warning(f"Timed out waiting for patent content on {url}")
+        return driver.page_source
+
+# HTML2Text keeps parse state on the instance, so each worker thread reuses its own
+_html2text_local = threading.local()
+
+def get_html2text():
+    """HTML 2 text convertor for claims, created once per thread"""
+    h = getattr(_html2text_local, "h", None)
+    if h is None:
         h = html2text.HTML2Text()
         h.ignore_links = True  # Ignore hyperlinks
         h.ignore_images = True  # Ignore images
         h.ignore_tables = False  # Keep tables as they might contain important data
         h.body_width = 0  # Don't wrap text at a certain width
+        _html2text_local.h = h
+    return h
+
+def extract_block_text(tree) -> str:
+    """
+    Text of the page body with one line per block element. Inline markup is
+    joined into the surrounding sentence and table cells are space separated.
+    Strip comments and processing instructions first, iterwalk skips them
+    along with their tails.
+    """
+    body = tree.find('body')
+    if body is None:
+        body = tree
+    parts = []
+    for event, element in etree.iterwalk(body, events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            if tag in BLOCK_TAGS:
+                parts.append('\n')
+            elif tag in CELL_TAGS:
+                parts.append(' ')
+            if element.text:
+                parts.append(WHITESPACE_RE.sub(' ', element.text))
+        else:
+            if tag in BLOCK_TAGS:
+                parts.append('\n')
+            elif tag in CELL_TAGS:
+                parts.append(' ')
+            if element.tail and element is not body:
+                parts.append(WHITESPACE_RE.sub(' ', element.tail))
+    return LINE_BREAKS_RE.sub('\n', SPACES_RE.sub(' ', ''.join(parts))).strip()
+
+# Patent page fields by itemprop, with the tag each one is expected on
+PATENT_FIELDS = {
+    'claims': 'section',
+    'abstract': 'section',
+    'inventor': 'dd',
+    'assigneeCurrent': 'dd',
+    'assigneeOriginal': 'dd',
+    'filingDate': 'time',
+    'title': 'span',
+}
+PATENT_FIELDS_XPATH = "//*[" + " or ".join(f"@itemprop='{name}'" for name in PATENT_FIELDS) + "]"
+
+def clean_html_content(url: str) -> Dict:
+    """
+    Fetch and extract content from HTML elements
+    Returns a dictionary with all patent information except claims
+    """
+    try:
+        logging.info(f"Fetching content from URL: {url}")
+        tree = None
+        try:
+            tree = lxml.html.fromstring(fetch_patent_html(url))
+        except requests.RequestException as e:
+            logging.warning(f"HTTP fetch failed for {url}: {e}")
+        
+        # Fall back to the browser only when the page didn't have the patent content
+        if tree is None or not tree.xpath("//span[@itemprop='title']"):
+            logging.info(f"Falling back to browser for {url}")
+            tree = lxml.html.fromstring(fetch_patent_html_with_browser(url))
         
-        # Extract all relevant sections
-        claims = soup.find('section', itemprop='claims')
-        abstract = soup.find('section', itemprop='abstract')
-        inventor = soup.find('dd', itemprop='inventor')
-        assigneeCurrent = soup.find('dd', itemprop='assigneeCurrent')
-        assigneeOriginal = soup.find('dd', itemprop='assigneeOriginal')
-        filingDate = soup.find('time', itemprop='filingDate')
-        title = soup.find('span', itemprop='title')
+        # Extract all relevant sections in one pass, keeping the first match per itemprop
+        sections = {}
+        for element in tree.xpath(PATENT_FIELDS_XPATH):
+            itemprop = element.get('itemprop')
+            if element.tag == PATENT_FIELDS[itemprop]:
+                sections.setdefault(itemprop, element)
+        claims = sections.get('claims')
+        abstract = sections.get('abstract')
+        inventor = sections.get('inventor')
+        assigneeCurrent = sections.get('assigneeCurrent')
+        assigneeOriginal = sections.get('assigneeOriginal')
+        filingDate = sections.get('filingDate')
+        title = sections.get('title')
         
-        # Process full text
-        full_text = h.handle(str(soup))
-        full_text = '\n'.join(line.strip() for line in full_text.splitlines() if line.strip())
+        # Process full text straight from the tree, html2text is only used for claims
+        etree.strip_elements(tree, 'script', 'style', 'noscript', with_tail=False)
+        # iterwalk skips comments and processing instructions, merge their tails into the text
+        etree.strip_tags(tree, etree.Comment, etree.ProcessingInstruction)
+        full_text = extract_block_text(tree)
         
         # Process claims text
-        claims_text = h.handle(str(claims)) if claims else None
+        claims_text = get_html2text().handle(lxml.html.tostring(claims, encoding='unicode')) if claims is not None else None
         if claims_text:
             claims_text = '\n'.join(line.strip() for line in claims_text.splitlines() if line.strip())
         
         # Create structured data
         patent_data = {
-            'patent_title': title.text.strip() if title else 'N/A',
-            'abstract': abstract.text.strip() if abstract else 'N/A',
-            'inventor_name': inventor.text.strip() if inventor else 'N/A',
-            'assignee_name': (assigneeCurrent.text.strip() if assigneeCurrent else 
-                            assigneeOriginal.text.strip() if assigneeOriginal else 'N/A'),
-            'filing_date': filingDate.text.strip() if filingDate else 'N/A',
+            'patent_title': title.text_content().strip() if title is not None else 'N/A',
+            'abstract': abstract.text_content().strip() if abstract is not None else 'N/A',
+            'inventor_name': inventor.text_content().strip() if inventor is not None else 'N/A',
+            'assignee_name': (assigneeCurrent.text_content().strip() if assigneeCurrent is not None else 
+                            assigneeOriginal.text_content().strip() if assigneeOriginal is not None else 'N/A'),
+            'filing_date': filingDate.text_content().strip() if filingDate is not None else 'N/A',
             'claims_text': claims_text,
             "patent_text": full_text
         }
@@ -180,8 +388,7 @@ def extract_patent_info_with_llm(url):
     patent_info['patent_url'] = url
     
     # Extract publication number from URL
-    pattern = r"/patent/([^/]+)/"
-    match = re.search(pattern, url)
+    match = PATENT_URL_RE.search(url)
     patent_info['publication_number'] = match.group(1) if match else 'N/A'
     
     # Store claims text in inventions if available, otherwise empty list
@@ -200,25 +407,34 @@ def read_patent_urls_from_file(filename="test_url.txt"):
         logging.error(f"Error: {filename} not found. Please run getlinks.py first to generate the file.")
         return []
 
-async def generate_embeddings(text, model_name="all-MiniLM-L6-v2"):
-    logging.info(f"Generating embeddings using model: {model_name}")
-    embedding = model.encode(text, convert_to_numpy=True)
-    logging.info("Generated embedding")
-    return embedding
-
-async def store_in_chromadb(text, embedding, collection_name="patents_collection"):
-    logging.info(f"Storing data in ChromaDB collection: {collection_name}")
-    client = chromadb.PersistentClient(path="./chromadb_store")
-    collection = client.get_or_create_collection(collection_name, metadata={"hnsw:space": "cosine"}, embedding_function=None)
-
-    doc_id = str(uuid.uuid4())
-    collection.add(
-        ids=[doc_id],
-        embeddings=[embedding.tolist()],
-        documents=[text],
+def generate_embeddings(texts):
+    # Only texts that haven't been embedded before go through the model
+    keys, cached, uncached = find_uncached_texts(texts, embedding_cache)
+    logging.info(f"Generating embeddings for {len(uncached)} documents using model: {model_name()} "
+                 f"({len(texts) - len(uncached)} cached)")
+    if uncached:
+        new_embeddings = get_model().encode(
+            [texts[i] for i in uncached],
+            batch_size=EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+        new_keys = [keys[i] for i in uncached]
+        embedding_cache.put_many(new_keys, new_embeddings)
+        cached.update(zip(new_keys, new_embeddings))
+    logging.info("Generated embeddings")
+    return np.stack([cached[k] for k in keys])
+
+def store_in_chromadb(texts, embeddings):
+    logging.info(f"Storing {len(texts)} documents in ChromaDB collection: {COLLECTION_NAME}")
+    doc_ids = [str(uuid.uuid4()) for _ in texts]
+    get_collection().add(
+        ids=doc_ids,
+        embeddings=embeddings,
+        documents=texts,
     )
-    logging.info(f"Added document with ID {doc_id} to ChromaDB.")
-    return doc_id
+    logging.info(f"Added {len(doc_ids)} documents to ChromaDB.")
+    return doc_ids
 
 def process_patents():
     logging.info("Starting patent processing")
@@ -232,100 +448,208 @@ def process_patents():
     finally:
         logging.info("Patent processing completed")
 
-# Example usage
-def main():
-    # Initialize IPFS handler
-    ipfs_handler = IPFSHandler()
-    
-    # Create patent_json directory if it doesn't exist
-    if not os.path.exists('patent_json'):
-        os.makedirs('patent_json')
-        logging.info("Created patent_json directory")
-    
-    # Read patent URLs from the text file instead of calling getLinks
-    patent_urls = read_patent_urls_from_file()
-    if not patent_urls:
-        logging.info("No patent URLs found in patent_urls.txt. Exiting...")
+async def upload_batch(ipfs_handler, pending_uploads, processed_patents):
+    """Upload the queued (patent_no, patent_data) pairs to IPFS in one batch"""
+    if not pending_uploads:
         return
-        
-    logging.info(f"Found {len(patent_urls)} patent URLs to process from patent_urls.txt")
-    
-    processed_patents = []
-    skipped_patents = []
-    
-    for url in patent_urls:
+    logging.info(f"Uploading {len(pending_uploads)} patents to IPFS...")
+    ipfs_hashes = await ipfs_handler.upload_batch(pending_uploads)
+
+    for patent_no, _ in pending_uploads:
+        ipfs_hash = ipfs_hashes.get(patent_no)
+        if ipfs_hash:
+            logging.info(f"Successfully processed patent {patent_no}")
+            logging.info(f"IPFS Hash: {ipfs_hash}")
+            logging.info(f"Local JSON file saved in: patent_json/{patent_no}.json.gz")
+            processed_patents.append(patent_no)
+        else:
+            logging.info(f"Failed to upload patent {patent_no} to IPFS")
+
+async def process_one(url, semaphore, state):
+    """Pipeline stage: fetch and parse one patent URL"""
+    async with semaphore:
         # Clean the URL (remove @ symbol if present)
         url = url.strip().replace("@", "")
         logging.info(f"\nProcessing URL: {url}")
         
         try:
-            # Updated regex pattern to match the exact format
-            pattern = r"/patent/([A-Z0-9]+)"
-
-            match = re.search(pattern, url)
-            patent_no = match.group(1)
+            match = PATENT_URL_RE.search(url)
+            patent_no = match.group(1) if match else None
             
             if not patent_no:
                 logging.info("Invalid URL format. Skipping...")
-                skipped_patents.append(url)
-                continue
+                state["skipped"].append(url)
+                return
             
             # Change this line to use proper string formatting
             logging.info(f"Processing patent number: {patent_no}")
 
-            # Check if JSON already exists
-            json_path = f"patent_json/{patent_no}.json"
-            if os.path.exists(json_path):
+            # Check if JSON already exists (or the patent is already being processed in this run)
+            if patent_no in state["seen"]:
                 logging.info(f"Patent {patent_no} already exists in local storage, skipping...")
-                skipped_patents.append(patent_no)
-                continue
+                state["skipped"].append(patent_no)
+                return
+            state["seen"].add(patent_no)
+
+            # Extract patent information using LLM (blocking browser work runs in a thread)
+            patent_data = await asyncio.to_thread(extract_patent_info_with_llm, url)
 
-            # Extract patent information using LLM
-            patent_data = extract_patent_info_with_llm(url)
+            # Add a small delay between requests to avoid rate limiting
+            await asyncio.sleep(REQUEST_DELAY)
             # logging.info(patent_data)
             if patent_data:
                 # Get patent number from the data
                 # patent_number = patent_data.get('publication_number', '')
                 patent_data["publication_number"] = patent_no
                 
-                # Save JSON file locally
-                # json_path = f"patent_json/{patent_number}.json"
-                try:
-                    with open(json_path, 'w', encoding='utf-8') as f:
-                        json.dump(patent_data, f, indent=4, ensure_ascii=False)
-                    logging.info(f"Saved JSON file locally: {json_path}")
-                    
-                    # Generate embeddings and store in ChromaDB
-                    text = json.dumps(patent_data)  # Convert patent data to string
-                    embedding = asyncio.run(generate_embeddings(text))
-                    doc_id = asyncio.run(store_in_chromadb(text, embedding))
-                    logging.info(f"Successfully stored in ChromaDB with ID: {doc_id}")
-                        
-                except Exception as e:
-                    logging.error(f"Error saving JSON file or storing in ChromaDB: {e}")
-                    continue
-                
-                # Save to IPFS and get the hash
-                logging.info(f"Uploading patent {patent_no} to IPFS...")
-                ipfs_hash = ipfs_handler.save_and_upload(patent_data, patent_no)
-                
-                if ipfs_hash:
-                    logging.info(f"Successfully processed patent {patent_no}")
-                    logging.info(f"IPFS Hash: {ipfs_hash}")
-                    logging.info(f"Local JSON file saved in: {json_path}")
-                    processed_patents.append(patent_no)
-                else:
-                    logging.info(f"Failed to upload patent {patent_no} to IPFS")
+                # Hand off to the embed stage, blocks while that stage is backed up
+                await state["parsed"].put((patent_no, patent_data))
             else:
                 logging.info("Failed to extract patent information")
                 
         except Exception as e:
             logging.error(f"Error processing patent URL {url}: {str(e)}")
-            continue
+            return
+
+async def embed_worker(parsed, persist):
+    """Pipeline stage: embed whatever parsed patents are waiting, up to EMBEDDING_BATCH_SIZE at a time"""
+    done = False
+    while not done:
+        batch = []
+        item = await parsed.get()
+        # Take what's already queued, batches grow on their own when this stage falls behind
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= EMBEDDING_BATCH_SIZE or parsed.empty():
+                break
+            item = parsed.get_nowait()
+        done = item is None
+
+        # A bad patent or batch is logged and dropped, an exception escaping this
+        # loop would stall the fetch workers on the full queue
+        try:
+            # Serialize once, the same bytes are embedded and written to disk
+            serialized, blobs = [], []
+            for patent_no, patent_data in batch:
+                try:
+                    blobs.append(orjson.dumps(patent_data))
+                    serialized.append((patent_no, patent_data))
+                except Exception as e:
+                    logging.error(f"Error serializing patent {patent_no}: {e}")
+            if not serialized:
+                continue
+            texts = [blob.decode('utf-8') for blob in blobs]
+            try:
+                embeddings = await asyncio.to_thread(generate_embeddings, texts)
+            except Exception as e:
+                logging.error(f"Error generating embeddings: {e}")
+                embeddings = None
+            await persist.put((serialized, blobs, texts, embeddings))
+        except Exception as e:
+            logging.error(f"Error in embed stage, dropping {len(batch)} patents: {e}")
+    await persist.put(None)
+
+def save_patent_json(patent_no, blob):
+    """Save the serialized patent JSON locally, returns False if it couldn't be written"""
+    json_path = f"patent_json/{patent_no}.json.gz"
+    try:
+        Path(json_path).write_bytes(gzip.compress(blob, compresslevel=3))
+        logging.info(f"Saved JSON file locally: {json_path}")
+        return True
+    except Exception as e:
+        logging.error(f"Error saving JSON file: {e}")
+        return False
+
+def persist_batch(batch, blobs, texts, embeddings):
+    """Write the JSON files and add the batch to ChromaDB, returns the patents that were saved"""
+    saved = [i for i, ((patent_no, _), blob) in enumerate(zip(batch, blobs)) if save_patent_json(patent_no, blob)]
+    if embeddings is not None and saved:
+        try:
+            doc_ids = store_in_chromadb([texts[i] for i in saved], embeddings[saved])
+            for i, doc_id in zip(saved, doc_ids):
+                logging.info(f"Successfully stored {batch[i][0]} in ChromaDB with ID: {doc_id}")
+        except Exception as e:
+            logging.error(f"Error storing in ChromaDB: {e}")
+    return [batch[i] for i in saved]
+
+async def persist_worker(persist, ipfs_handler, state):
+    """Pipeline stage: write JSON, add to ChromaDB and queue IPFS uploads"""
+    while (item := await persist.get()) is not None:
+        try:
+            saved = await asyncio.to_thread(persist_batch, *item)
             
-        # Add a small delay between requests to avoid rate limiting
-        time.sleep(2)
+            # Queue for IPFS, full batches upload in the background while scraping continues
+            state["pending_uploads"].extend(saved)
+            if len(state["pending_uploads"]) >= IPFS_BATCH_SIZE:
+                batch, state["pending_uploads"] = state["pending_uploads"], []
+                state["upload_tasks"].append(
+                    asyncio.create_task(upload_batch(ipfs_handler, batch, state["processed"]))
+                )
+        except Exception as e:
+            logging.error(f"Error in persist stage, dropping {len(item[0])} patents: {e}")
+
+async def process_all(patent_urls):
+    """
+    Process all URLs as a pipeline: fetch + parse (at most MAX_CONCURRENT_PATENTS
+    in flight) -> embed -> persist (JSON, ChromaDB, IPFS). Stages are connected by
+    bounded queues so they overlap without buffering the whole run in memory.
+    """
+    state = {"processed": [], "skipped": [], "pending_uploads": [], "upload_tasks": []}
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PATENTS)
+    # One listdir up front instead of a stat per URL (plain .json files are from older runs)
+    state["seen"] = {fn.split(".", 1)[0] for fn in os.listdir("patent_json") if fn.endswith((".json.gz", ".json"))}
+    state["parsed"] = asyncio.Queue(maxsize=EMBEDDING_BATCH_SIZE)
+    persist = asyncio.Queue(maxsize=PERSIST_QUEUE_SIZE)
+
+    async with AsyncIPFSHandler() as ipfs_handler:
+        embed_task = asyncio.create_task(embed_worker(state["parsed"], persist))
+        persist_task = asyncio.create_task(persist_worker(persist, ipfs_handler, state))
+
+        producers = asyncio.gather(*(process_one(url, semaphore, state) for url in patent_urls))
+        # If a stage dies the producers would block on its queue forever, fail fast instead
+        done, _ = await asyncio.wait(
+            {producers, embed_task, persist_task}, return_when=asyncio.FIRST_COMPLETED
+        )
+        if producers not in done:
+            stage = done.pop()
+            for task in (producers, embed_task, persist_task):
+                task.cancel()
+            await asyncio.gather(producers, embed_task, persist_task, return_exceptions=True)
+            raise RuntimeError("Pipeline stage exited before the URLs were processed") from stage.exception()
+        # Drain the pipeline
+        await state["parsed"].put(None)
+        await asyncio.gather(embed_task, persist_task)
+
+        state["upload_tasks"].append(
+            asyncio.create_task(upload_batch(ipfs_handler, state["pending_uploads"], state["processed"]))
+        )
+        for result in await asyncio.gather(*state["upload_tasks"], return_exceptions=True):
+            if isinstance(result, Exception):
+                logging.error(f"Error uploading batch to IPFS: {result}")
+
+    return state["processed"], state["skipped"]
+
+# Example usage
+def main():
+    # Create patent_json directory if it doesn't exist
+    if not os.path.exists('patent_json'):
+        os.makedirs('patent_json')
+        logging.info("Created patent_json directory")
     
+    # Read patent URLs from the text file instead of calling getLinks
+    patent_urls = read_patent_urls_from_file()
+    if not patent_urls:
+        logging.info("No patent URLs found in patent_urls.txt. Exiting...")
+        return
+        
+    logging.info(f"Found {len(patent_urls)} patent URLs to process from patent_urls.txt")
+    
+    try:
+        processed_patents, skipped_patents = asyncio.run(process_all(patent_urls))
+    finally:
+        browser_pool.close()
+        embedding_cache.close()
+
     # Print summary
     logging.info("\nProcessing Summary:")
     logging.info(f"Total patents processed: {len(processed_patents)}")